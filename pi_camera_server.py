@@ -2,20 +2,38 @@
 """
 Raspberry Pi Zero Camera Server for FTC Robot - Low Latency Version
 Install: pip3 install picamera2 flask opencv-python
+Optional: pip3 install simplejpeg (faster software JPEG encoding)
 Run: python3 camera_server.py
 """
 
 from flask import Flask, Response, render_template_string, request, jsonify, session, redirect, url_for
-from picamera2 import Picamera2
-from picamera2.encoders import H264Encoder
+from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.serving import WSGIRequestHandler
+from picamera2 import Picamera2, MappedArray
+from picamera2.encoders import H264Encoder, MJPEGEncoder
 from picamera2.outputs import FileOutput
 import time
 import threading
 from datetime import datetime
 import os
 import cv2
+import numpy as np
+try:
+    import simplejpeg  # libjpeg-turbo with NEON, no extra buffer copy
+except ImportError:
+    simplejpeg = None
 import secrets
 import hashlib
+import hmac
+import re
+import json
+import gzip
+import queue
+import socket
+import subprocess
+import functools
+import struct
+from multiprocessing import shared_memory
 
 app = Flask(__name__)
 
@@ -26,14 +44,43 @@ app.secret_key = secrets.token_hex(32)
 camera = None
 recording = False
 recording_lock = threading.Lock()
+recording_filename = None
+recording_fps = None  # Rate the current recording runs at - settings may change before it stops
 stream_active = False
-
-# Latest frame storage for streaming - NOW WITH TIMESTAMP
-latest_frame = None
-latest_frame_timestamp = 0
-latest_frame_lock = threading.Lock()
+# Bumped every time the camera is (re)initialized so clients know when to reopen the stream
+stream_epoch = 0
+# Full sensor size (width, height) once a camera has been opened; the UI hides larger modes
+sensor_resolution = None
+# Sizes the running configuration actually delivers, which can differ from the requested ones
+# after alignment: {'record': (w, h), 'live_view': (w, h)}
+camera_sizes = None
+
+# Latest frame slot for streaming - clients block on frame_ready until latest_frame_seq moves
+# latest_part is the newest JPEG already framed as a multipart part, built once per frame by
+# publish_frame. It is an immutable bytes object: producers only ever rebind it, never modify it,
+# so readers take the reference under the lock and send it after releasing - no per-client copy
+latest_part = None
+latest_frame_seq = 0
+frame_ready = threading.Condition()
+# Open /video_feed connections; the software grabber only captures and encodes while there are some
+mjpeg_clients = 0
+# Reused colour-conversion target for lores frames when simplejpeg isn't installed
+yuv_convert_buffer = None
+# The grabber lowers JPEG quality down to this floor when encoding falls behind the frame rate
+JPEG_QUALITY_FLOOR = 40
+JPEG_QUALITY_STEP = 5
 frame_grabber_thread = None
 frame_grabber_running = False
+# Hardware MJPEG encoder feeding latest_part; None when the software frame grabber is in use
+stream_encoder = None
+# H.264 encoder attached to the main stream while recording
+record_encoder = None
+# camera_layout() as of the last init_camera - the settings the running configuration was built from
+configured_layout = None
+# H.264 live stream - encoder runs only while /video_feed_h264 has clients, one queue per client
+h264_encoder = None
+h264_clients = set()
+h264_lock = threading.Lock()
 
 # Default settings - LOWER DEFAULTS FOR BETTER LATENCY
 stream_config = {
@@ -49,17 +96,148 @@ record_config = {
     'fps': 30
 }
 
+# Serialized /status payload as (state key, body, etag) - rebuilt only when the state changes
+status_cache = (None, b'', '')
+state_changed = threading.Condition()
+
+# Recording bitrate by minimum frame width - higher resolution needs higher bitrate
+BITRATE_LADDER = (
+    (1920, 20000000),  # 20Mbps for Full HD+
+    (1280, 15000000),  # 15Mbps for HD
+    (0, 10000000),     # 10Mbps for SD
+)
+
+# Converted mp4 downloads are kept this long after their last request so interrupted
+# downloads can resume against the same file; path -> deletion deadline
+MP4_KEEP_SECONDS = 600
+mp4_expiry = {}
+# Serializes ffmpeg remuxes so a download never races the background conversion of the same file
+convert_lock = threading.Lock()
+
+# multipart/x-mixed-replace framing around each JPEG on /video_feed
+JPEG_PART_PREFIX = b'--frame\r\nContent-Type: image/jpeg\r\nContent-Length: '
+JPEG_PART_SUFFIX = b'\r\n'
+
+def jpeg_part(jpeg):
+    """Frame one JPEG as a multipart part; Content-Length lets the browser decode without scanning for the boundary"""
+    # join sizes the result once and copies the JPEG a single time; chained + copies it per operator
+    return b''.join((JPEG_PART_PREFIX, b'%d\r\n\r\n' % len(jpeg), jpeg, JPEG_PART_SUFFIX))
+
+# Small black frame sent when the camera can't be opened - a JPEG, like every other part
+NO_SIGNAL_PART = jpeg_part(cv2.imencode('.jpg', np.zeros((16, 16, 3), dtype=np.uint8), [cv2.IMWRITE_JPEG_QUALITY, 30])[1].tobytes())
+
+# Controls that never change at runtime; only FrameRate is patched in per configuration
+BASE_CONTROLS = {"AeEnable": True, "AwbEnable": True}
+
+# VideoCore H.264 encoder (V4L2 memory-to-memory). Without it picamera2 encodes in software,
+# which can't keep up with HD recording, so recording is refused instead
+H264_ENCODER_DEVICE = "/dev/video11"
+
+# Recordings live here; created once when the server starts rather than on every recording
+VIDEO_DIR = "/home/pi/videos"
+
+# The latest stream JPEG is mirrored into /dev/shm/picam_jpeg so other local processes
+# (analytics, archivers) can read frames without opening the camera or re-encoding.
+# Layout: little-endian (pid:u32, seq:u32, length:u32) header, then the JPEG. pid is the
+# server that owns the block; seq is 0 while a frame is being written, and a reader copies
+# the JPEG and keeps it if seq hasn't changed.
+SHM_NAME = "picam_jpeg"
+SHM_HEADER = struct.Struct("<III")
+SHM_SIZE = SHM_HEADER.size + 4 * 1024 * 1024
+
+def shm_owner_alive():
+    """True if a frame block exists and the server that created it is still running"""
+    # Read the header through the file rather than attaching - an attached SharedMemory is
+    # registered with multiprocessing's resource tracker, which would unlink it at our exit
+    try:
+        with open(f"/dev/shm/{SHM_NAME}", 'rb') as f:
+            pid = SHM_HEADER.unpack(f.read(SHM_HEADER.size))[0]
+    except (OSError, struct.error):
+        return False
+    if pid == 0:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass  # Alive, just owned by another user
+    return True
+
+def open_frame_shm():
+    """Create the shared frame block, replacing one left behind by a crashed run; None if unavailable"""
+    try:
+        try:
+            shm = shared_memory.SharedMemory(name=SHM_NAME, create=True, size=SHM_SIZE)
+        except FileExistsError:
+            # Only a dead server's block is replaced - a second instance started by mistake
+            # mustn't pull the block from under the running one before failing to bind the port
+            if shm_owner_alive():
+                print("Shared memory frame output disabled: another server is publishing frames")
+                return None
+            stale = shared_memory.SharedMemory(name=SHM_NAME)
+            stale.close()
+            stale.unlink()
+            shm = shared_memory.SharedMemory(name=SHM_NAME, create=True, size=SHM_SIZE)
+    except OSError as e:
+        print(f"Shared memory frame output disabled: {e}")
+        return None
+    SHM_HEADER.pack_into(shm.buf, 0, os.getpid(), 0, 0)
+    return shm
+
+# Opened when the server starts, not on import - importing this module for SHM_NAME/SHM_HEADER
+# must not replace a running server's block
+frame_shm = None
+
+# Only names produced by start_recording are accepted by download/delete. Raw H.264 carries no
+# timing, so the recording rate is part of the name; older recordings without it use record fps.
+RECORDING_NAME_RE = re.compile(r'video_\d{8}_\d{6}(?:_(\d+)fps)?\.h264')
+
+def recorded_fps(filename):
+    """Frame rate a recording was made at, from its name"""
+    match = RECORDING_NAME_RE.fullmatch(filename)
+    return int(match.group(1)) if match and match.group(1) else record_config['fps']
+
 # Default login credentials - CHANGE THESE!
 DEFAULT_USERNAME = "admin"
-DEFAULT_PASSWORD = "gary2026"  # Hash this in production
+DEFAULT_PASSWORD = "gary2026"
+
+# Explicit method rather than Werkzeug's default, which is scrypt on current versions - about
+# 32 MB and a second of CPU per hash on a Pi Zero, for every unauthenticated /login attempt
+PASSWORD_HASH_METHOD = "pbkdf2:sha256:50000"
 
 def hash_password(password):
-    """Simple password hashing - use werkzeug.security in production"""
-    return hashlib.sha256(password.encode()).hexdigest()
+    """Salted PBKDF2 password hash"""
+    return generate_password_hash(password, method=PASSWORD_HASH_METHOD)
 
 def verify_password(stored_hash, password):
-    """Verify password against hash"""
-    return stored_hash == hash_password(password)
+    """Verify password against hash - constant-time comparison"""
+    return check_password_hash(stored_hash, password)
+
+@functools.lru_cache(maxsize=None)
+def default_password_hash():
+    """Hash of the login password - computed on first login rather than at import"""
+    return hash_password(DEFAULT_PASSWORD)
+
+def advise_sequential(fileobj):
+    """Tell the kernel a file will be accessed front to back"""
+    try:
+        os.posix_fadvise(fileobj.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+    except (AttributeError, OSError) as e:
+        print(f"fadvise error: {e}")
+
+def drop_file_cache(path):
+    """Drop a finished file's pages from the page cache so they don't push out hot memory"""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+    except (AttributeError, OSError) as e:
+        print(f"fadvise error: {e}")
+    finally:
+        os.close(fd)
 
 def require_login(f):
     """Decorator to require login for routes"""
@@ -70,70 +248,304 @@ def require_login(f):
     decorated_function.__name__ = f.__name__
     return decorated_function
 
+def current_status():
+    """Return (state key, JSON body, etag) for the current state, re-serializing only if it changed"""
+    global status_cache
+    key = (recording, stream_active, camera is not None, stream_epoch, sensor_resolution,
+           camera_sizes and tuple(camera_sizes.items()), tuple(stream_config.items()), tuple(record_config.items()))
+    if key != status_cache[0]:
+        body = json.dumps({
+            'recording': recording,
+            'stream_active': stream_active,
+            'camera_ready': camera is not None,
+            'stream_epoch': stream_epoch,
+            'sensor_resolution': sensor_resolution,
+            'camera_sizes': camera_sizes,
+            'stream_config': stream_config,
+            'record_config': record_config
+        }).encode()
+        status_cache = (key, body, hashlib.sha1(body).hexdigest()[:16])
+    return status_cache
+
+def notify_state_change():
+    """Wake /events streams so they push the new state right away"""
+    with state_changed:
+        state_changed.notify_all()
+
+def precompressed_response(content, mimetype):
+    """Build a response from (body, gzipped body, etag), using the gzip copy when the client accepts it"""
+    body, body_gz, etag = content
+    if 'gzip' in request.accept_encodings:
+        response = Response(body_gz, mimetype=mimetype)
+        response.headers['Content-Encoding'] = 'gzip'
+        response.set_etag(etag + '-gz')
+    else:
+        response = Response(body, mimetype=mimetype)
+        response.set_etag(etag)
+    response.vary.add('Accept-Encoding')
+    return response
+
+def pick_bitrate(width):
+    """Look up the H.264 bitrate for a recording width"""
+    return next(bitrate for min_width, bitrate in BITRATE_LADDER if width >= min_width)
+
+def close_camera(cam):
+    """Best-effort camera teardown - every step is attempted even if an earlier one fails"""
+    for step in (cam.stop_recording, cam.stop, cam.close):
+        try:
+            step()
+        except Exception as e:
+            print(f"Camera {step.__name__} error: {e}")
+
+def camera_layout():
+    """Settings baked into the camera configuration - changing any of them needs a camera restart"""
+    # The software grabber reads quality per frame; only the hardware encoder fixes it at start
+    quality = stream_config['quality'] if stream_encoder is not None else None
+    return (stream_config['width'], stream_config['height'], stream_config['fps'], quality,
+            record_config['width'], record_config['height'])
+
+def aligned_size(width, height):
+    """Round width down to the ISP's 64-pixel YUV420 alignment and rescale height to keep the aspect ratio"""
+    aligned = max(64, width // 64 * 64)
+    return aligned, max(2, round(height * aligned / width / 2) * 2)
+
+def live_view_stream():
+    """picamera2 stream the live view is taken from - the stream-sized lores copy when there is one"""
+    return 'lores' if camera.camera_config.get('lores') else 'main'
+
 def init_camera():
-    global camera, stream_active
+    global camera, stream_active, stream_epoch, stream_encoder, sensor_resolution, configured_layout, camera_sizes
     try:
         # Always stop and release previous camera if exists
+        stop_h264_stream()
+        stream_encoder = None
         if camera is not None:
-            try:
-                camera.stop()
-                camera.close()
-            except Exception as e:
-                print(f"Camera stop/close error during re-init: {e}")
+            close_camera(camera)
             camera = None
             stream_active = False
             time.sleep(1)  # Give hardware time to fully reset
 
         print("Initializing camera...")
         camera = Picamera2()
+        # Read from the camera properties - unlike sensor_modes this doesn't cycle the sensor
+        sensor_resolution = tuple(camera.sensor_resolution)
+        
+        # Main always runs at the recording size and the ISP scales a stream-width lores copy
+        # for the live view, so recording only attaches an encoder - no reconfigure, no stall.
+        # The cost is that the sensor mode follows the record size even when idle: the live view
+        # shares the recording's field of view and aspect ratio, and is capped at that mode's
+        # frame rate (e.g. lower for the full-sensor 2592x1944 preset).
+        # Sizes are aligned here rather than by align_configuration(), which only narrows the width
+        # and so squeezes the picture horizontally
+        record_size = aligned_size(record_config['width'], record_config['height'])
+        stream_width = aligned_size(stream_config['width'], stream_config['height'])[0]
+        lores = None
+        if stream_width < record_size[0]:
+            # lores is scaled from main's field of view - give it main's aspect ratio, not the
+            # stream setting's, or the picture is stretched (320x240 from 1920x1080 -> 320x180)
+            lores_height = max(2, round(record_size[1] * stream_width / record_size[0] / 2) * 2)
+            lores = {"size": (stream_width, lores_height), "format": "YUV420"}
         
-        # Use video configuration with framerate control
+        # YUV420 is what the H.264 encoder consumes, at half the buffer memory of RGB888
         config = camera.create_video_configuration(
-            main={"size": (stream_config['width'], stream_config['height']), 
-                  "format": "RGB888"},
-            controls={"FrameRate": stream_config['fps']}
+            main={"size": record_size, 
+                  "format": "YUV420"},
+            lores=lores,
+            controls={**BASE_CONTROLS, "FrameRate": stream_config['fps']},
+            # Main is allocated at the record size for as long as the camera runs - picamera2's
+            # default of 6 buffers would hold ~45 MB of CMA at 2592x1944, too much for a Pi Zero
+            buffer_count=4
         )
         
-        print(f"Camera config: {stream_config['width']}x{stream_config['height']} @ {stream_config['fps']}fps")
+        # Already aligned, so this only confirms the sizes the encoders can take without a copy
+        camera.align_configuration(config)
+        print(f"Camera config: main {config['main']['size']}, live view {(config['lores'] or config['main'])['size']} @ {stream_config['fps']}fps")
         camera.configure(config)
-        
-        # Set auto exposure and auto white balance
-        camera.set_controls({
-            "AeEnable": True,
-            "AwbEnable": True
-        })
-        
+        camera_sizes = {'record': tuple(config['main']['size']),
+                        'live_view': tuple((config['lores'] or config['main'])['size'])}
         camera.start()
         time.sleep(2)
         
         stream_active = True
+        stream_epoch += 1
         print("Camera initialized successfully")
-        start_frame_grabber()
+        start_stream_output(live_view_stream())
+        configured_layout = camera_layout()
     except Exception as e:
         print(f"Error initializing camera: {e}")
         stream_active = False
         camera = None
+    notify_state_change()
+
+class FrameSink:
+    """File-like target for picamera2's encoder output - publishes each JPEG as the latest frame"""
+
+    def write(self, buf):
+        # buf may be a view of the encoder's mmap buffer, refilled next frame - publish_frame
+        # frames it into a new bytes object straight away, which is the one copy it needs
+        publish_frame(buf)
+        return len(buf)
+
+    def flush(self):
+        pass
+
+def mjpeg_bitrate():
+    """Approximate the JPEG quality setting as a bitrate - about quality/50 bits per pixel"""
+    return int(stream_config['width'] * stream_config['height'] * stream_config['fps'] * stream_config['quality'] / 50)
+
+def start_stream_output(name='main'):
+    """Stream with the hardware JPEG encoder if the Pi has one, else fall back to the software frame grabber"""
+    global stream_encoder
+    try:
+        encoder = MJPEGEncoder(bitrate=mjpeg_bitrate())
+        camera.start_encoder(encoder, FileOutput(FrameSink()), name=name)
+        stream_encoder = encoder
+        print("Streaming with hardware MJPEG encoder")
+    except Exception as e:
+        # Pi 5 has no JPEG block; older picamera2 can't run a second encoder
+        print(f"Hardware MJPEG encoder unavailable, using software encoding: {e}")
+        stream_encoder = None
+        start_frame_grabber()
+
+class H264Fanout:
+    """File-like encoder target that copies H.264 output to every live stream client"""
+
+    def write(self, buf):
+        with h264_lock:
+            for client in h264_clients:
+                try:
+                    client.put_nowait(buf)
+                except queue.Full:
+                    pass  # Slow client loses data; it resyncs at the next keyframe
+        return len(buf)
+
+    def flush(self):
+        pass
+
+def add_h264_client(client):
+    """Register a stream client, starting the H.264 encoder for the first one; False if it can't start"""
+    global h264_encoder
+    with h264_lock:
+        if h264_encoder is None:
+            try:
+                # Baseline profile and a keyframe every second so players can join and recover quickly
+                encoder = H264Encoder(bitrate=max(500000, stream_config['width'] * stream_config['height'] * stream_config['fps'] // 10),
+                                      repeat=True, iperiod=stream_config['fps'], profile='baseline')
+                camera.start_encoder(encoder, FileOutput(H264Fanout()), name=live_view_stream())
+                h264_encoder = encoder
+            except Exception as e:
+                print(f"H.264 stream encoder unavailable: {e}")
+                return False
+        h264_clients.add(client)
+        return True
+
+def remove_h264_client(client):
+    """Unregister a stream client, stopping the encoder when the last one leaves"""
+    with h264_lock:
+        h264_clients.discard(client)
+        if h264_clients:
+            return
+    stop_h264_stream()
+
+def stop_h264_stream():
+    """Detach the H.264 stream encoder; connected clients see the stream end"""
+    global h264_encoder
+    with h264_lock:
+        encoder, h264_encoder = h264_encoder, None
+    if encoder is not None:
+        try:
+            camera.stop_encoder(encoder)
+        except Exception as e:
+            print(f"Error stopping H.264 stream encoder: {e}")
+
+def publish_frame(jpeg):
+    """Make jpeg (bytes or a buffer valid for this call) the latest stream frame and wake every waiting client"""
+    global latest_part, latest_frame_seq
+    # Framed once here, outside the lock, rather than by every client for every frame
+    part = jpeg_part(jpeg)
+    with frame_ready:
+        latest_part = part
+        latest_frame_seq += 1
+        frame_ready.notify_all()
+        if frame_shm is not None and SHM_HEADER.size + len(jpeg) <= SHM_SIZE:
+            buf = frame_shm.buf
+            SHM_HEADER.pack_into(buf, 0, os.getpid(), 0, 0)
+            buf[SHM_HEADER.size:SHM_HEADER.size + len(jpeg)] = jpeg
+            SHM_HEADER.pack_into(buf, 0, os.getpid(), latest_frame_seq & 0xFFFFFFFF or 1, len(jpeg))
+
+def encode_jpeg(frame, quality):
+    """JPEG-encode a captured frame at the given quality; None on failure"""
+    # picamera2's "RGB888" is B,G,R byte order in memory - what OpenCV expects natively
+    if simplejpeg is not None:
+        return simplejpeg.encode_jpeg(frame, quality=quality, colorspace='BGR', fastdct=True)
+    ret, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    return buffer.tobytes() if ret else None
+
+def encode_yuv420_jpeg(image, width, height, quality):
+    """JPEG-encode a planar YUV420 capture - height*3/2 rows at the buffer's stride"""
+    stride = image.shape[1]
+    if simplejpeg is not None:
+        # Encode the planes directly, skipping the colour conversion
+        flat = image.reshape(-1)
+        start = height * stride
+        chroma = (height // 2) * (stride // 2)
+        u = flat[start:start + chroma].reshape(height // 2, stride // 2)
+        v = flat[start + chroma:start + 2 * chroma].reshape(height // 2, stride // 2)
+        return simplejpeg.encode_jpeg_yuv_planes(
+            np.ascontiguousarray(image[:height, :width]),
+            np.ascontiguousarray(u[:, :width // 2]),
+            np.ascontiguousarray(v[:, :width // 2]),
+            quality=quality, fastdct=True)
+    global yuv_convert_buffer
+    # Convert into the same array every frame rather than allocating a full-size BGR image
+    if yuv_convert_buffer is None or yuv_convert_buffer.shape != (height, stride, 3):
+        yuv_convert_buffer = np.empty((height, stride, 3), dtype=np.uint8)
+    cv2.cvtColor(image, cv2.COLOR_YUV420p2BGR, dst=yuv_convert_buffer)
+    return encode_jpeg(yuv_convert_buffer[:, :width], quality)
 
 def frame_grabber():
     """Continuously grab the latest frame from the camera."""
-    global latest_frame, latest_frame_timestamp, frame_grabber_running, camera, stream_active
-    frame_delay = 1.0 / stream_config['fps']
+    global frame_grabber_running, camera, stream_active
+    # No sleep between frames: capture_request blocks until the next frame, which the
+    # camera's FrameRate control already delivers at the configured rate
+    quality = stream_config['quality']
+    encode_ms = 0.0
     while frame_grabber_running:
-        if not stream_active or camera is None:
+        if not stream_active or camera is None or not mjpeg_clients:
             time.sleep(0.2)
             continue
         try:
-            frame = camera.capture_array()
-            # Use configured quality setting
-            ret, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, stream_config['quality']])
-            if ret:
-                with latest_frame_lock:
-                    latest_frame = buffer.tobytes()
-                    latest_frame_timestamp = time.time()
+            # The ISP has already scaled the live view into the lores stream when there is one
+            name = live_view_stream()
+            stream = camera.camera_config[name]
+            # Encode straight out of the camera's buffer instead of copying it into a fresh
+            # array, then hand the buffer back; the JPEG bytes don't reference it
+            req = camera.capture_request()
+            # The configured quality is the ceiling; never adapt above what the user asked for
+            ceiling = stream_config['quality']
+            quality = max(min(quality, ceiling), min(JPEG_QUALITY_FLOOR, ceiling))
+            started = time.perf_counter()
+            try:
+                with MappedArray(req, name) as mapped:
+                    if stream['format'] == 'YUV420':
+                        jpeg = encode_yuv420_jpeg(mapped.array, *stream['size'], quality)
+                    else:
+                        jpeg = encode_jpeg(mapped.array, quality)
+            finally:
+                req.release()
+            # Moving average of encode time against the frame budget: step quality down when
+            # encoding can't keep up with the frame rate, back up once there's plenty of headroom
+            encode_ms = 0.9 * encode_ms + 0.1 * (time.perf_counter() - started) * 1000
+            budget_ms = 1000 / stream_config['fps']
+            if encode_ms > budget_ms:
+                quality = max(JPEG_QUALITY_FLOOR, quality - JPEG_QUALITY_STEP)
+            elif encode_ms < budget_ms / 2:
+                quality = min(ceiling, quality + JPEG_QUALITY_STEP)
+            if jpeg is not None:
+                publish_frame(jpeg)
         except Exception as e:
             print(f"Frame grabber error: {e}")
             time.sleep(0.1)
-        time.sleep(frame_delay)
 
 def start_frame_grabber():
     global frame_grabber_thread, frame_grabber_running
@@ -151,57 +563,54 @@ def stop_frame_grabber():
 
 def generate_frames():
     """Serve the most recent MJPEG frame for streaming with aggressive latency reduction."""
-    global stream_active, camera, latest_frame, latest_frame_timestamp
+    global stream_active, camera, mjpeg_clients
     
     if not stream_active or camera is None:
         print("Camera not active, initializing...")
         init_camera()
     if not stream_active or camera is None:
         print("Camera not available for streaming")
-        blank = b'\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR\x00\x00\x00\x01\x00\x00\x00\x01\x08\x02\x00\x00\x00\x90wS\xde\x00\x00\x00\x0cIDATx\x9cc\xf8\x0f\x00\x00\x01\x01\x00\x05\x18l\xf6\x00\x00\x00\x00IEND\xaeB`\x82'
-        yield (b'--frame\r\n'
-               b'Content-Type: image/png\r\n\r\n' + blank + b'\r\n')
+        yield NO_SIGNAL_PART
         time.sleep(1)
         return
 
-    frame_delay = 1.0 / stream_config['fps']
-    last_sent_timestamp = 0
+    last_seq = 0
+    # Every client is served the same encoded bytes - the JPEG work doesn't grow with viewers
+    with frame_ready:
+        mjpeg_clients += 1
     
     try:
         while True:
-            with latest_frame_lock:
-                frame_bytes = latest_frame
-                frame_timestamp = latest_frame_timestamp
+            # CRITICAL: Only send a frame newer than the last one sent - the camera's
+            # FrameRate paces the producer, so each client just sleeps until it publishes
+            with frame_ready:
+                if not frame_ready.wait_for(lambda: latest_frame_seq != last_seq, timeout=1):
+                    continue  # Camera stalled or restarting - keep waiting
+                part = latest_part
+                last_seq = latest_frame_seq
             
-            # CRITICAL: Only send frame if it's newer than last sent
-            # This prevents sending old frames and reduces buffering
-            if frame_bytes is not None and frame_timestamp > last_sent_timestamp:
-                yield (b'--frame\r\n'
-                       b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
-                last_sent_timestamp = frame_timestamp
-            else:
-                # Frame not ready or already sent - send minimal data to keep connection alive
-                # This prevents browser buffering while waiting for new frames
-                time.sleep(frame_delay * 0.5)  # Check more frequently than frame rate
-                continue
-            
-            # Small delay to match target framerate
-            time.sleep(frame_delay * 0.8)  # Slightly faster to prevent backup
+            yield part
             
     except GeneratorExit:
         print("Stream client disconnected")
     except Exception as e:
         print(f"Streaming error: {e}")
         stream_active = False
+    finally:
+        with frame_ready:
+            mjpeg_clients -= 1
 
 @app.route('/login', methods=['POST'])
 def login():
-    data = request.json
+    data = request.get_json(silent=True) or {}
     username = data.get('username', '')
     password = data.get('password', '')
+    if not isinstance(username, str) or not isinstance(password, str):
+        return jsonify({'status': 'error', 'message': 'Invalid credentials'}), 401
     
-    # Check credentials
-    if username == DEFAULT_USERNAME and password == DEFAULT_PASSWORD:
+    # Check credentials - both always evaluated so timing doesn't reveal a valid username
+    username_ok = hmac.compare_digest(username.encode(), DEFAULT_USERNAME.encode())
+    if verify_password(default_password_hash(), password) & username_ok:
         session['user'] = username
         return jsonify({'status': 'success', 'message': 'Logged in'})
     else:
@@ -214,97 +623,107 @@ def logout():
 
 @app.route('/')
 def index():
-    if 'user' not in session:
-        return render_template_string(LOGIN_INTERFACE)
-    return render_template_string(WEB_INTERFACE)
+    response = precompressed_response(WEB_PAGE if 'user' in session else LOGIN_PAGE, 'text/html')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.vary.add('Cookie')
+    return response.make_conditional(request)
+
+@app.route('/assets/<name>')
+def asset(name):
+    """Serve a content-hashed asset; a new hash means a new URL, so browsers may cache it forever"""
+    if name not in ASSETS:
+        return "Not found", 404
+    content, mimetype = ASSETS[name]
+    response = precompressed_response(content, mimetype)
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response.make_conditional(request)
 
 @app.route('/video_feed')
 @require_login
 def video_feed():
     # Add cache control headers to prevent buffering
+    # generate_frames already yields bytes - direct_passthrough hands them straight to the
+    # server instead of running every frame through Werkzeug's per-chunk encoding wrapper
     response = Response(generate_frames(),
-                       mimetype='multipart/x-mixed-replace; boundary=frame')
+                       mimetype='multipart/x-mixed-replace; boundary=frame',
+                       direct_passthrough=True)
     response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
     response.headers['Pragma'] = 'no-cache'
     response.headers['Expires'] = '0'
     response.headers['X-Accel-Buffering'] = 'no'  # Disable nginx buffering if present
     return response
 
+@app.route('/video_feed_h264')
+@require_login
+def video_feed_h264():
+    """Raw H.264 (Annex B) live stream for players such as ffplay or VLC - a fraction of MJPEG's bandwidth"""
+    if recording or camera is None or not stream_active:
+        return "H.264 stream unavailable while recording or without a camera", 503
+    client = queue.Queue(maxsize=2 * stream_config['fps'])
+    if not add_h264_client(client):
+        return "H.264 encoder unavailable", 503
+
+    def generate():
+        try:
+            while True:
+                try:
+                    yield client.get(timeout=2)
+                except queue.Empty:
+                    # Encoder was stopped for a recording or camera restart
+                    if h264_encoder is None:
+                        return
+        finally:
+            remove_h264_client(client)
+
+    response = Response(generate(), mimetype='video/h264', direct_passthrough=True)
+    response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
 @app.route('/start_recording', methods=['POST'])
 @require_login
 def start_recording():
-    global recording, camera
+    global recording, recording_filename, recording_fps, record_encoder
     
     with recording_lock:
         if recording:
             return jsonify({'status': 'error', 'message': 'Already recording'})
         
+        if not os.path.exists(H264_ENCODER_DEVICE):
+            return jsonify({'status': 'error', 'message': 'Hardware H.264 encoder not available'}), 503
+        
+        # Record size changed through /update_record_settings - the main stream has to follow
+        if camera is not None and camera_layout() != configured_layout:
+            restart_stream_camera()
+        
         if camera is None:
             return jsonify({'status': 'error', 'message': 'Camera not initialized'})
         
         try:
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"/home/pi/videos/video_{timestamp}.h264"
-            os.makedirs("/home/pi/videos", exist_ok=True)
+            fps = record_config['fps']
+            filename = f"{VIDEO_DIR}/video_{datetime.now():%Y%m%d_%H%M%S}_{fps}fps.h264"
             
             print(f"Starting recording to {filename}")
-            print(f"Recording settings: {record_config['width']}x{record_config['height']} @ {record_config['fps']}fps")
-            
-            # Stop current camera and reconfigure for recording
-            try:
-                camera.stop()
-            except Exception as e:
-                print(f"Error stopping camera before reconfigure: {e}")
-            
-            time.sleep(1)  # Longer pause for high-res switching
-            
-            try:
-                # Configure camera with recording settings
-                video_config = camera.create_video_configuration(
-                    main={"size": (record_config['width'], record_config['height']), 
-                          "format": "RGB888"},
-                    controls={"FrameRate": record_config['fps']}
-                )
-                camera.configure(video_config)
-            except Exception as e:
-                print(f"Error configuring camera: {e}")
-                raise
-            
-            # Set auto exposure and white balance
-            try:
-                camera.set_controls({
-                    "AeEnable": True,
-                    "AwbEnable": True
-                })
-            except Exception as e:
-                print(f"Error setting controls: {e}")
-            
-            try:
-                camera.start()
-            except Exception as e:
-                print(f"Error starting camera: {e}")
-                raise
-            
-            time.sleep(2)  # Let camera stabilize - important for high resolution
+            print(f"Recording settings: {record_config['width']}x{record_config['height']} @ {fps}fps")
             
-            # Create encoder with appropriate bitrate
-            # Higher resolution needs higher bitrate
-            if record_config['width'] >= 1920:
-                bitrate = 20000000  # 20Mbps for Full HD+
-            elif record_config['width'] >= 1280:
-                bitrate = 15000000  # 15Mbps for HD
-            else:
-                bitrate = 10000000  # 10Mbps for SD
+            # The live H.264 stream would compete with the recording for the encoder
+            stop_h264_stream()
             
-            try:
-                encoder = H264Encoder(bitrate=bitrate)
-                output = FileOutput(filename)
-                camera.start_recording(encoder, output)
-            except Exception as e:
-                print(f"Error starting encoder: {e}")
-                raise
+            # FrameRate is a runtime control - the configuration itself stays as it is
+            camera.set_controls({"FrameRate": fps})
+            # Keyframe with repeated SPS/PPS every second, so a cut-off file still plays and seeks well
+            encoder = H264Encoder(bitrate=pick_bitrate(record_config['width']),
+                                  repeat=True, iperiod=fps)
+            output = FileOutput(filename)
+            camera.start_encoder(encoder, output, name='main')
+            # Recordings are written once front to back - keep them from crowding the page cache
+            advise_sequential(output.fileoutput)
             
+            record_encoder = encoder
             recording = True
+            recording_filename = filename
+            recording_fps = fps
+            notify_state_change()
             
             print("Recording started successfully")
             return jsonify({
@@ -315,129 +734,140 @@ def start_recording():
         except Exception as e:
             print(f"Recording start error: {e}")
             recording = False
-            # Try to recover camera for streaming
-            try:
-                if camera:
-                    try:
-                        camera.stop_recording()
-                    except:
-                        pass
-                    try:
-                        camera.stop()
-                    except:
-                        pass
-                    try:
-                        camera.close()
-                    except:
-                        pass
-                camera = None
-            except:
-                pass
-            time.sleep(1)
             try:
-                init_camera()
-            except Exception as init_err:
-                print(f"Recovery init error: {init_err}")
+                camera.set_controls({"FrameRate": stream_config['fps']})
+            except Exception as ctrl_err:
+                print(f"Error restoring stream frame rate: {ctrl_err}")
             return jsonify({'status': 'error', 'message': str(e)})
 
 @app.route('/stop_recording', methods=['POST'])
 @require_login
 def stop_recording():
-    global recording, camera, stream_active
+    global recording, recording_filename, recording_fps, record_encoder
     with recording_lock:
         if not recording:
             return jsonify({'status': 'error', 'message': 'Not recording'})
         try:
             print("Stopping recording")
             try:
-                camera.stop_recording()
+                camera.stop_encoder(record_encoder)
             except Exception as e:
                 print(f"Error stopping recording: {e}")
-            try:
-                camera.stop()
-            except Exception as e:
-                print(f"Error stopping camera: {e}")
+            record_encoder = None
+            if recording_filename:
+                drop_file_cache(recording_filename)
+                # Remux right away so the download is ready when asked for
+                threading.Thread(target=preconvert_recording, args=(recording_filename, recording_fps), daemon=True).start()
+                recording_filename = None
             recording = False
-            time.sleep(0.5)
-            try:
-                camera.close()
-            except Exception as e:
-                print(f"Camera close error: {e}")
-            camera = None
-            stream_active = False
-            stop_frame_grabber()
-            time.sleep(1)
-            init_camera()
+            
+            if camera_layout() != configured_layout:
+                # Settings saved during the recording were held back until now
+                restart_stream_camera()
+            else:
+                # The live view never stopped - just return it to its own frame rate
+                try:
+                    camera.set_controls({"FrameRate": stream_config['fps']})
+                except Exception as e:
+                    print(f"Error restoring stream frame rate: {e}")
+                notify_state_change()
             print("Recording stopped successfully")
             return jsonify({'status': 'success'})
         except Exception as e:
             print(f"Recording stop error: {e}")
             recording = False
+            recording_filename = None
             # Try to recover camera
-            try:
-                if camera:
-                    try:
-                        camera.stop_recording()
-                    except:
-                        pass
-                    try:
-                        camera.stop()
-                    except:
-                        pass
-                    try:
-                        camera.close()
-                    except:
-                        pass
-            except Exception as e2:
-                print(f"Camera stop error during recovery: {e2}")
-            camera = None
-            stream_active = False
-            time.sleep(1)
-            try:
-                init_camera()
-            except Exception as e3:
-                print(f"Camera re-init error during recovery: {e3}")
+            restart_stream_camera()
             return jsonify({'status': 'error', 'message': str(e)})
 
 @app.route('/status', methods=['GET'])
 @require_login
 def status():
-    return jsonify({
-        'recording': recording,
-        'stream_active': stream_active,
-        'camera_ready': camera is not None,
-        'stream_config': stream_config,
-        'record_config': record_config
-    })
+    _, body, etag = current_status()
+
+    # Polls with a matching If-None-Match get an empty 304 instead of the JSON body
+    response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
+@app.route('/events')
+@require_login
+def events():
+    """Server-Sent Events stream that pushes the /status payload whenever it changes"""
+    def event_stream():
+        last_etag = None
+        last_sent = time.monotonic()
+        # Reconnect quickly after a camera restart or reboot drops the stream
+        yield b'retry: 2000\n\n'
+        while True:
+            _, body, etag = current_status()
+            if etag != last_etag:
+                last_etag = etag
+                last_sent = time.monotonic()
+                yield b'data: ' + body + b'\n\n'
+            elif time.monotonic() - last_sent >= 15:
+                # Comment line keeps proxies from closing an idle stream and detects dead clients
+                last_sent = time.monotonic()
+                yield b': keepalive\n\n'
+            # Woken immediately on known state changes; the timeout catches everything else
+            with state_changed:
+                state_changed.wait(timeout=1)
+
+    response = Response(event_stream(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
 
 @app.route('/list_recordings', methods=['GET'])
 @require_login
 def list_recordings():
     try:
-        video_dir = "/home/pi/videos"
-        if not os.path.exists(video_dir):
+        if not os.path.exists(VIDEO_DIR):
             return jsonify({'status': 'success', 'recordings': []})
         
+        with os.scandir(VIDEO_DIR) as it:
+            entries = [entry for entry in it if entry.name.endswith('.h264')]
+        
+        # Directory mtime moves on create/delete; a recording in progress only grows, so add its size
+        growing = 0
+        if recording and recording_filename:
+            try:
+                growing = os.path.getsize(recording_filename)
+            except OSError:
+                pass
+        etag = f"{os.stat(VIDEO_DIR).st_mtime_ns:x}-{len(entries)}-{growing:x}"
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+            response.set_etag(etag)
+            return response
+        
         files = []
-        for filename in os.listdir(video_dir):
-            if filename.endswith('.h264'):
-                filepath = os.path.join(video_dir, filename)
-                size = os.path.getsize(filepath)
-                mtime = os.path.getmtime(filepath)
-                files.append({
-                    'name': filename,
-                    'size': size,
-                    'size_mb': round(size / (1024 * 1024), 2),
-                    'date': datetime.fromtimestamp(mtime).strftime('%Y-%m-%d %H:%M:%S')
-                })
+        for entry in entries:
+            st = entry.stat()  # One stat per file for both size and mtime
+            files.append(recording_entry(entry.name, st.st_size, st.st_mtime))
         
         # Sort by date, newest first
         files.sort(key=lambda x: x['date'], reverse=True)
         
-        return jsonify({'status': 'success', 'recordings': files})
+        response = jsonify({'status': 'success', 'recordings': files})
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)})
 
+@functools.lru_cache(maxsize=256)
+def recording_entry(name, size, mtime):
+    """Listing entry for one recording - cached, since size and mtime only change while recording"""
+    return {
+        'name': name,
+        'size': size,
+        'size_mb': round(size / (1024 * 1024), 2),
+        'date': datetime.fromtimestamp(mtime).strftime('%Y-%m-%d %H:%M:%S')
+    }
+
 @app.route('/download/<filename>')
 @require_login
 def download_file(filename):
@@ -445,60 +875,101 @@ def download_file(filename):
         if recording:
             return "Cannot download while recording", 400
         
-        video_dir = "/home/pi/videos"
-        filepath = os.path.join(video_dir, filename)
-        
-        # Security check - ensure filename doesn't contain path traversal
-        if '..' in filename or '/' in filename:
+        # Security check - only plain recording names, no paths or other file types
+        if not RECORDING_NAME_RE.fullmatch(filename):
             return "Invalid filename", 400
         
+        filepath = os.path.join(VIDEO_DIR, filename)
+        
         if not os.path.exists(filepath):
             return "File not found", 404
 
-        # Only allow .h264 files
-        if not filename.endswith('.h264'):
-            return "Invalid file type", 400
-
-        # Convert to mp4 using ffmpeg
-        mp4_filename = filename.replace('.h264', '.mp4')
-        mp4_filepath = os.path.join(video_dir, mp4_filename)
-
-        # Only convert if mp4 doesn't exist or is older than h264
-        convert_needed = (
-            not os.path.exists(mp4_filepath) or
-            os.path.getmtime(mp4_filepath) < os.path.getmtime(filepath)
-        )
-
-        if convert_needed:
-            import subprocess
-            ffmpeg_cmd = [
-                'ffmpeg',
-                '-y',  # Overwrite output file if exists
-                '-framerate', '30',  # Default framerate, could be improved by reading metadata
-                '-i', filepath,
-                '-c:v', 'copy',
-                mp4_filepath
-            ]
-            try:
-                subprocess.run(ffmpeg_cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            except Exception as e:
-                return f"ffmpeg conversion error: {e}", 500
+        # Usually already converted when the recording stopped
+        try:
+            mp4_filepath = convert_h264_to_mp4(filepath, recorded_fps(filename))
+        except Exception as e:
+            return f"ffmpeg conversion error: {e}", 500
+        mp4_filename = os.path.basename(mp4_filepath)
 
         from flask import send_file
-        # Send mp4 file as attachment
-        response = send_file(mp4_filepath, as_attachment=True, download_name=mp4_filename)
-        # Optionally, clean up mp4 after sending (comment out if you want to keep mp4s)
-        def cleanup_file(path):
-            time.sleep(10)
-            try:
-                os.remove(path)
-            except Exception as e:
-                print(f"Cleanup error: {e}")
-        threading.Thread(target=cleanup_file, args=(mp4_filepath,), daemon=True).start()
+        # Send mp4 file as attachment; conditional handles Range/If-Range so dropped downloads resume
+        response = send_file(mp4_filepath, as_attachment=True, download_name=mp4_filename, conditional=True)
+        # Downloads are read once - drop them from the page cache when the transfer finishes
+        response.call_on_close(lambda: (drop_file_cache(filepath), drop_file_cache(mp4_filepath)))
+        keep_mp4(mp4_filepath)
         return response
     except Exception as e:
         return str(e), 500
 
+def mp4_path_for(h264_path):
+    return h264_path[:-len('.h264')] + '.mp4'
+
+def convert_h264_to_mp4(h264_path, fps):
+    """Remux a raw H.264 recording into an mp4 beside it, unless an up-to-date one exists"""
+    mp4_path = mp4_path_for(h264_path)
+    with convert_lock:
+        if os.path.exists(mp4_path) and os.path.getmtime(mp4_path) >= os.path.getmtime(h264_path):
+            return mp4_path
+        # Remux under a temporary name and rename on success - a remux cut off by a crash or
+        # reboot would otherwise leave a truncated mp4 that looks up to date from then on
+        part_path = mp4_path + '.part'
+        ffmpeg_cmd = [
+            'ffmpeg',
+            '-fflags', '+genpts',  # Raw H.264 has no timestamps - generate them at the recording rate
+            '-r', str(fps),
+            '-i', h264_path,
+            '-c:v', 'copy',  # Remux only, no re-encode
+            '-an',
+            '-f', 'mp4',  # The .part name doesn't tell ffmpeg the container
+            '-y',  # Overwrite output file if exists
+            part_path
+        ]
+        try:
+            subprocess.run(ffmpeg_cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            os.replace(part_path, mp4_path)
+        except Exception:
+            try:
+                os.remove(part_path)
+            except OSError:
+                pass
+            raise
+    # Every mp4 is a second copy of its recording - it only stays while it's being asked for
+    keep_mp4(mp4_path)
+    return mp4_path
+
+def preconvert_recording(h264_path, fps):
+    """Background remux of a just-finished recording"""
+    try:
+        convert_h264_to_mp4(h264_path, fps)
+        drop_file_cache(h264_path)
+    except Exception as e:
+        print(f"Background conversion error: {e}")
+
+def keep_mp4(path):
+    """Keep a converted mp4 around for a while so a resumed download finds the same file"""
+    first_request = path not in mp4_expiry
+    mp4_expiry[path] = time.time() + MP4_KEEP_SECONDS
+    if first_request:
+        threading.Thread(target=expire_mp4, args=(path,), daemon=True).start()
+
+def expire_mp4(path):
+    """Delete a converted download once it hasn't been requested for MP4_KEEP_SECONDS"""
+    while True:
+        deadline = mp4_expiry.get(path)
+        if deadline is None:
+            return  # Deleted along with its recording in the meantime
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            break
+        time.sleep(remaining)
+    mp4_expiry.pop(path, None)
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        print(f"Cleanup error: {e}")
+
 @app.route('/delete/<filename>', methods=['POST'])
 @require_login
 def delete_file(filename):
@@ -506,49 +977,49 @@ def delete_file(filename):
         if recording:
             return jsonify({'status': 'error', 'message': 'Cannot delete while recording'})
         
-        video_dir = "/home/pi/videos"
-        filepath = os.path.join(video_dir, filename)
-        
         # Security check
-        if '..' in filename or '/' in filename:
+        if not RECORDING_NAME_RE.fullmatch(filename):
             return jsonify({'status': 'error', 'message': 'Invalid filename'})
         
+        filepath = os.path.join(VIDEO_DIR, filename)
+        
         if not os.path.exists(filepath):
             return jsonify({'status': 'error', 'message': 'File not found'})
         
         os.remove(filepath)
+        # Drop any converted download along with it
+        mp4_expiry.pop(mp4_path_for(filepath), None)
+        try:
+            os.remove(mp4_path_for(filepath))
+        except FileNotFoundError:
+            pass
+        recording_entry.cache_clear()
         return jsonify({'status': 'success', 'message': 'File deleted'})
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)})
 
-@app.route('/update_stream_settings', methods=['POST'])
-@require_login
-def update_stream_settings():
-    global stream_config, camera, stream_active
-    data = request.json
-    
-    if 'width' in data:
-        stream_config['width'] = int(data['width'])
-    if 'height' in data:
-        stream_config['height'] = int(data['height'])
-    if 'fps' in data:
-        stream_config['fps'] = int(data['fps'])
-    if 'quality' in data:
-        stream_config['quality'] = int(data['quality'])
-    
-    print(f"Stream settings updated: {stream_config['width']}x{stream_config['height']} @ {stream_config['fps']}fps, quality={stream_config['quality']}")
+def merge_settings(config, data):
+    """Copy known integer settings from a request body into a config dict; return the keys that changed"""
+    changed = set()
+    for key in config:
+        if key in data:
+            value = int(data[key])
+            if config[key] != value:
+                config[key] = value
+                changed.add(key)
+    return changed
+
+def settings_from_form(prefix):
+    """Pull '<prefix>_<key>' fields out of the flat form body of a settings request"""
+    return {key[len(prefix) + 1:]: value for key, value in request.form.items() if key.startswith(prefix + '_')}
+
+def restart_stream_camera():
+    """Tear down and re-init the camera so new stream or record sizes take effect"""
+    global camera, stream_active
     print("Restarting camera to apply new stream settings...")
-    # Force camera re-init to apply new settings immediately
     try:
         if camera:
-            try:
-                camera.stop()
-            except Exception as e:
-                print(f"Error stopping camera before re-init: {e}")
-            try:
-                camera.close()
-            except Exception as e:
-                print(f"Error closing camera before re-init: {e}")
+            close_camera(camera)
         camera = None
         stream_active = False
         stop_frame_grabber()
@@ -557,20 +1028,49 @@ def update_stream_settings():
     except Exception as e:
         print(f"Error re-initializing camera after stream settings update: {e}")
 
+@app.route('/update_settings', methods=['POST'])
+@require_login
+def update_settings():
+    """Apply stream and record settings together, restarting the camera at most once"""
+    if request.is_json:
+        data = request.json
+        record, stream = data.get('record', {}), data.get('stream', {})
+    else:
+        record, stream = settings_from_form('record'), settings_from_form('stream')
+    
+    with recording_lock:
+        merge_settings(record_config, record)
+        merge_settings(stream_config, stream)
+        print(f"Settings updated: stream {stream_config['width']}x{stream_config['height']} @ {stream_config['fps']}fps, quality={stream_config['quality']}; "
+              f"record {record_config['width']}x{record_config['height']} @ {record_config['fps']}fps")
+        # Record fps is applied when a recording starts; anything in the camera configuration needs
+        # a restart. While recording, stop_recording restarts with the new settings.
+        if camera_layout() != configured_layout and not recording:
+            restart_stream_camera()
+    notify_state_change()
+    
+    return jsonify({'status': 'success', 'stream_settings': stream_config, 'record_settings': record_config})
+
+@app.route('/update_stream_settings', methods=['POST'])
+@require_login
+def update_stream_settings():
+    with recording_lock:
+        merge_settings(stream_config, request.form or request.get_json())
+        
+        print(f"Stream settings updated: {stream_config['width']}x{stream_config['height']} @ {stream_config['fps']}fps, quality={stream_config['quality']}")
+        # Same rule as /update_settings: restart only when the layout changed, and never under a
+        # running recording - stop_recording applies it afterwards
+        if camera_layout() != configured_layout and not recording:
+            restart_stream_camera()
+    notify_state_change()
+
     return jsonify({'status': 'success', 'settings': stream_config})
 
 @app.route('/update_record_settings', methods=['POST'])
 @require_login
 def update_record_settings():
-    global record_config
-    data = request.json
-    
-    if 'width' in data:
-        record_config['width'] = int(data['width'])
-    if 'height' in data:
-        record_config['height'] = int(data['height'])
-    if 'fps' in data:
-        record_config['fps'] = int(data['fps'])
+    merge_settings(record_config, request.form or request.get_json())
+    notify_state_change()
     
     return jsonify({'status': 'success', 'settings': record_config})
 
@@ -582,7 +1082,8 @@ def reboot():
         if recording:
             return jsonify({'status': 'error', 'message': 'Cannot reboot while recording'})
         # Respond before rebooting to avoid client disconnect
-        threading.Thread(target=lambda: (time.sleep(1), os.system('sudo reboot')), daemon=True).start()
+        # Exec shutdown directly (no shell) and let systemd stop services in order
+        threading.Thread(target=lambda: (time.sleep(1), subprocess.Popen(['sudo', 'shutdown', '-r', 'now'])), daemon=True).start()
         return jsonify({'status': 'success', 'message': 'Rebooting Raspberry Pi...'})
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)})
@@ -775,245 +1276,837 @@ LOGIN_INTERFACE = '''
 </html>
 '''
 
+WEB_CSS = '''
+* { margin: 0; padding: 0; box-sizing: border-box; }
+body {
+    font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Arial, sans-serif;
+    background: #000;
+    color: #fff;
+    overflow-x: hidden;
+    display: flex;
+    align-items: center;
+    justify-content: center;
+}
+.container {
+    max-width: 720px;
+    padding: 10px;
+    position: relative;
+}
+#stream {
+    height: auto;
+    display: block;
+    border: 2px solid #333;
+    border-radius: 8px;
+    background: #1a1a1a;
+    min-height: 240px;
+    object-fit: contain;
+    width: 100%;
+}
+@media (min-width: 750px) {
+    #stream {
+        width: 640px;
+    }
+}
+.controls {
+    margin-top: 15px;
+    display: flex;
+    flex-direction: column;
+    gap: 10px;
+}
+button {
+    padding: 15px 20px;
+    font-size: 16px;
+    font-weight: 600;
+    border: none;
+    border-radius: 8px;
+    cursor: pointer;
+    transition: all 0.2s;
+}
+.record-btn {
+    background: #dc3545;
+    color: white;
+}
+.record-btn:active { background: #c82333; }
+.record-btn.recording {
+    background: #28a745;
+    animation: pulse 1.5s infinite;
+}
+.record-btn:disabled {
+    background: #555;
+    cursor: not-allowed;
+}
+@keyframes pulse {
+    0%, 100% { opacity: 1; }
+    50% { opacity: 0.7; }
+}
+.settings-btn {
+    background: #6c757d;
+    color: white;
+}
+.settings-btn:active { background: #5a6268; }
+.status {
+    background: #1a1a1a;
+    padding: 12px;
+    border-radius: 8px;
+    margin-top: 10px;
+    font-size: 14px;
+}
+.status.error {
+    background: #dc3545;
+}
+.settings-panel {
+    display: none;
+    background: #1a1a1a;
+    padding: 15px;
+    border-radius: 8px;
+    margin-top: 10px;
+}
+.settings-panel.active { display: block; }
+.setting-group {
+    margin-bottom: 15px;
+}
+.setting-group label {
+    display: block;
+    margin-bottom: 5px;
+    font-size: 14px;
+    color: #aaa;
+}
+.setting-group select {
+    width: 100%;
+    padding: 10px;
+    background: #2a2a2a;
+    border: 1px solid #444;
+    border-radius: 5px;
+    color: #fff;
+    font-size: 14px;
+}
+h3 {
+    color: #4CAF50;
+    margin-bottom: 15px;
+    font-size: 16px;
+}
+.save-btn {
+    background: #007bff;
+    color: white;
+    width: 100%;
+}
+.save-btn:active { background: #0056b3; }
+.info-text {
+    color: #aaa;
+    font-size: 12px;
+    margin-top: 5px;
+}
+.recordings-panel {
+    display: none;
+    background: #1a1a1a;
+    padding: 15px;
+    border-radius: 8px;
+    margin-top: 10px;
+    max-height: 400px;
+    overflow-y: auto;
+}
+.recordings-panel.active { display: block; }
+.recording-item {
+    background: #2a2a2a;
+    padding: 12px;
+    border-radius: 5px;
+    margin-bottom: 10px;
+}
+.recording-name {
+    font-weight: 600;
+    color: #fff;
+    margin-bottom: 5px;
+}
+.recording-info {
+    font-size: 12px;
+    color: #aaa;
+    margin-bottom: 8px;
+}
+.recording-actions {
+    display: flex;
+    gap: 8px;
+}
+.download-btn {
+    background: #28a745;
+    color: white;
+    padding: 8px 12px;
+    font-size: 14px;
+    flex: 1;
+}
+.download-btn:active { background: #218838; }
+.download-btn:disabled {
+    background: #555;
+    cursor: not-allowed;
+}
+.delete-btn {
+    background: #dc3545;
+    color: white;
+    padding: 8px 12px;
+    font-size: 14px;
+    flex: 1;
+}
+.delete-btn:active { background: #c82333; }
+.delete-btn:disabled {
+    background: #555;
+    cursor: not-allowed;
+}
+.empty-message {
+    text-align: center;
+    color: #aaa;
+    padding: 20px;
+}
+.recordings-btn {
+    background: #17a2b8;
+    color: white;
+}
+.recordings-btn:active { background: #138496; }
+.logout-btn {
+    background: #dc3545;
+    color: white;
+    font-size: 14px;
+    padding: 10px 15px;
+    position: absolute;
+    top: 10px;
+    right: 10px;
+}
+.logout-btn:active { background: #c82333; }
+.user-info {
+    position: absolute;
+    top: 10px;
+    left: 10px;
+    color: #aaa;
+    font-size: 12px;
+}
+.reboot-btn {
+    background: #ff9800;
+    color: white;
+    font-size: 14px;
+    padding: 10px 15px;
+    position: absolute;
+    top: 10px;
+    right: 110px;
+}
+.reboot-btn:active { background: #e68900; }
+.latency-indicator {
+    position: absolute;
+    top: 60px;
+    right: 10px;
+    background: rgba(0, 0, 0, 0.7);
+    padding: 8px 12px;
+    border-radius: 5px;
+    font-size: 12px;
+    color: #4CAF50;
+}
+'''
+
+WEB_JS = '''
+let isRecording = false;
+let cameraReady = false;
+let lastFrameTime = Date.now();
+let streamEpoch = null;
+let streamRetries = 0;
+let recordingsEtag = null;
+// Reopening the recordings panel within this long of the last load shows the list as it is
+const RECORDINGS_TTL_MS = 10000;
+let recordingsLoadedAt = 0;
+
+// Monitor stream for latency
+const streamImg = document.getElementById('stream');
+// The page renders the stream URL into the <img>; epochs are appended to it
+const streamBase = streamImg.getAttribute('src');
+// Elements the stream and status handlers update, looked up once
+const statusEl = document.getElementById('status');
+const recordBtn = document.getElementById('recordBtn');
+const latencyIndicator = document.getElementById('latencyIndicator');
+const settingsPanel = document.getElementById('settingsPanel');
+const recordingsPanel = document.getElementById('recordingsPanel');
+const recordingsList = document.getElementById('recordingsList');
+streamImg.addEventListener('load', function() {
+    const now = Date.now();
+    const latency = now - lastFrameTime;
+    lastFrameTime = now;
+
+    if (latency < 200) {
+        latencyIndicator.style.color = '#4CAF50'; // Green
+        latencyIndicator.textContent = `Latency: ${latency}ms (Good)`;
+    } else if (latency < 500) {
+        latencyIndicator.style.color = '#ff9800'; // Orange
+        latencyIndicator.textContent = `Latency: ${latency}ms (OK)`;
+    } else {
+        latencyIndicator.style.color = '#dc3545'; // Red
+        latencyIndicator.textContent = `Latency: ${latency}ms (High)`;
+    }
+});
+
+// Settings choices - [value, label, selected by default]
+const SETTING_OPTIONS = {
+    streamRes: [
+        [[192, 144], 'Ultra Low Latency'],
+        [[320, 240], 'Low Latency - Recommended', true],
+        [[424, 240], '16:9 Low Latency'],
+        [[480, 320], 'Compact 3:2'],
+        [[640, 360], '16:9 Balanced'],
+        [[640, 480], '4:3 Balanced'],
+        [[800, 450], '16:9 High Quality'],
+        [[800, 600], '4:3 High Quality']
+    ],
+    streamFps: [
+        [15, 'Lowest Bandwidth'],
+        [24, 'Good Balance'],
+        [30, 'Smooth', true]
+    ],
+    streamQuality: [
+        [30, 'Lowest Latency'],
+        [40, 'Very Low Latency'],
+        [50, 'Low Latency - Recommended', true],
+        [60, 'Balanced'],
+        [70, 'Good Quality'],
+        [80, 'High Quality']
+    ],
+    recordRes: [
+        [[640, 480], 'SD'],
+        [[1024, 768], '4:3 Medium'],
+        [[1280, 720], 'HD 16:9'],
+        [[1280, 960], 'HD 4:3'],
+        [[1440, 1080], '2MP 4:3'],
+        [[1600, 1200], '2MP 4:3'],
+        [[1920, 1440], '3MP 4:3'],
+        [[1920, 1080], 'Full HD 16:9', true],
+        [[2048, 1152], 'Oversampled 16:9'],
+        [[2592, 1458], 'Max 16:9 Crop'],
+        [[2592, 1080], 'Super-Wide 2.40:1'],
+        [[2592, 1944], '5MP Full Sensor 4:3']
+    ],
+    recordFps: [
+        [15, 'Low Light'],
+        [24, 'Cinematic'],
+        [30, 'Standard', true],
+        [45, 'Fast Smooth'],
+        [60, 'High Motion']
+    ]
+};
+
+function optionText(id, value, label) {
+    if (id.endsWith('Res')) return `${value[0]}x${value[1]} (${label})`;
+    if (id.endsWith('Fps')) return `${value} FPS (${label})`;
+    return `${value}% (${label})`;
+}
+
+// Fill every settings <select> once, in a single append per list
+function buildSettingOptions() {
+    for (const [id, choices] of Object.entries(SETTING_OPTIONS)) {
+        document.getElementById(id).append(...choices.map(([value, label, selected]) =>
+            new Option(optionText(id, value, label), String(value), !!selected, !!selected)));
+    }
+}
+
+buildSettingOptions();
+
+// Hide resolutions the sensor can't deliver so they can't trigger a failing reconfigure
+let sensorLimit = null;
+function limitResolutions(size) {
+    if (!size || String(size) === sensorLimit) {
+        return;
+    }
+    sensorLimit = String(size);
+    for (const id of ['streamRes', 'recordRes']) {
+        for (const option of document.getElementById(id).options) {
+            const [w, h] = option.value.split(',').map(Number);
+            option.hidden = option.disabled = (w > size[0] || h > size[1]);
+        }
+    }
+}
+
+// Load current settings on page load
+function loadCurrentSettings() {
+    fetch('/status')
+        .then(r => r.json())
+        .then(data => {
+            cameraReady = data.camera_ready;
+            limitResolutions(data.sensor_resolution);
+
+            // Update stream settings
+            const streamRes = `${data.stream_config.width},${data.stream_config.height}`;
+            document.getElementById('streamRes').value = streamRes;
+            document.getElementById('streamFps').value = data.stream_config.fps;
+            document.getElementById('streamQuality').value = data.stream_config.quality;
+
+            // Update record settings
+            const recordRes = `${data.record_config.width},${data.record_config.height}`;
+            document.getElementById('recordRes').value = recordRes;
+            document.getElementById('recordFps').value = data.record_config.fps;
+
+            // Update initial status
+            updateStatusDisplay(data);
+        })
+        .catch(err => {
+            console.log('Failed to load settings:', err);
+            statusEl.textContent = 'Status: Waiting for camera...';
+            statusEl.classList.remove('error');
+        });
+}
+
+function updateStatusDisplay(data) {
+    if (data.recording) {
+        statusEl.textContent = 'Status: Recording...';
+        statusEl.classList.remove('error');
+    } else if (data.camera_ready) {
+        statusEl.textContent = 'Status: Ready';
+        statusEl.classList.remove('error');
+    } else if (data.stream_active) {
+        statusEl.textContent = 'Status: Camera initializing...';
+        statusEl.classList.remove('error');
+    } else {
+        statusEl.textContent = 'Status: Waiting for camera...';
+        statusEl.classList.remove('error');
+    }
+}
+
+// Load settings when page loads
+loadCurrentSettings();
+
+function handleStreamError() {
+    statusEl.textContent = 'Status: Camera stream error - refreshing...';
+    statusEl.classList.add('error');
+    setTimeout(() => {
+        // A failed connection needs a fresh URL even if the epoch hasn't moved
+        streamRetries++;
+        streamImg.src = streamUrl() + '&retry=' + streamRetries;
+    }, 2000);
+}
+
+// POSTs still waiting for a response, by URL - repeat taps on a slow link are dropped
+const inflight = new Set();
+
+function safePost(url, options = {}, btn = null) {
+    if (inflight.has(url)) {
+        return Promise.resolve(null);
+    }
+    inflight.add(url);
+    if (btn) {
+        btn.disabled = true;
+    }
+    return fetch(url, Object.assign({ method: 'POST' }, options))
+        .then(r => r.json())
+        .finally(() => {
+            inflight.delete(url);
+            if (btn) {
+                btn.disabled = false;
+            }
+        });
+}
+
+function toggleRecording() {
+    if (!cameraReady) {
+        alert('Camera not ready. Please wait...');
+        return;
+    }
+
+    const url = isRecording ? '/stop_recording' : '/start_recording';
+
+    safePost(url, {}, recordBtn)
+        .then(data => {
+            if (!data) {
+                return;
+            }
+            if (data.status === 'success') {
+                // The status stream may already have reported the change
+                const nowRecording = (url === '/start_recording');
+                if (nowRecording !== isRecording) {
+                    isRecording = nowRecording;
+                    updateUI();
+                }
+            } else {
+                alert('Error: ' + data.message);
+                statusEl.textContent = 'Status: Error - ' + data.message;
+                statusEl.classList.add('error');
+            }
+        })
+        .catch(err => {
+            alert('Error: ' + err);
+            statusEl.textContent = 'Status: Connection error';
+            statusEl.classList.add('error');
+        });
+}
+
+function updateUI() {
+    statusEl.classList.remove('error');
+    // Recording start/stop changes the list and whether its buttons are usable
+    recordingsLoadedAt = 0;
+
+    if (isRecording) {
+        recordBtn.textContent = 'STOP RECORDING';
+        recordBtn.classList.add('recording');
+        statusEl.textContent = 'Status: Recording...';
+    } else {
+        recordBtn.textContent = 'START RECORDING';
+        recordBtn.classList.remove('recording');
+        // The live view keeps running; a camera restart, if any, is announced by a new epoch
+        statusEl.textContent = 'Status: Recording stopped';
+    }
+}
+
+function streamUrl() {
+    return streamBase + '?e=' + streamEpoch;
+}
+
+// Reopen the MJPEG connection only when the server has actually restarted the camera
+function applyStreamEpoch(data) {
+    if (streamEpoch === null) {
+        streamEpoch = data.stream_epoch;
+        return;
+    }
+    if (data.stream_epoch === streamEpoch || data.recording || !data.camera_ready || !data.stream_active) {
+        return;
+    }
+    streamEpoch = data.stream_epoch;
+
+    statusEl.textContent = 'Status: Reconnecting stream...';
+    streamImg.addEventListener('load', () => {
+        statusEl.textContent = 'Status: Ready';
+    }, { once: true });
+    streamImg.src = streamUrl();
+}
+
+function toggleSettings() {
+    recordingsPanel.classList.remove('active');
+    settingsPanel.classList.toggle('active');
+}
+
+function toggleRecordings() {
+    settingsPanel.classList.remove('active');
+
+    const wasActive = recordingsPanel.classList.contains('active');
+    recordingsPanel.classList.toggle('active');
+
+    if (!wasActive && Date.now() - recordingsLoadedAt > RECORDINGS_TTL_MS) {
+        loadRecordings();
+    }
+}
+
+function loadRecordings() {
+    if (recordingsEtag === null) {
+        recordingsList.innerHTML = '<div class="empty-message">Loading recordings...</div>';
+    }
+
+    // The browser revalidates with If-None-Match; an unchanged ETag means the rendered list is current
+    fetch('/list_recordings')
+        .then(r => {
+            recordingsLoadedAt = Date.now();
+            const tag = r.headers.get('ETag');
+            if (tag && tag === recordingsEtag) {
+                return null;
+            }
+            recordingsEtag = tag;
+            return r.json();
+        })
+        .then(data => {
+            if (!data) {
+                return;
+            }
+            if (data.status === 'success') {
+                if (data.recordings.length === 0) {
+                    recordingsList.innerHTML = '<div class="empty-message">No recordings found</div>';
+                } else {
+                    // Clone a row per recording; textContent keeps file names out of the HTML parser
+                    const row = document.getElementById('recordingRow').content;
+                    const frag = document.createDocumentFragment();
+                    for (const rec of data.recordings) {
+                        const item = row.cloneNode(true);
+                        item.firstElementChild.dataset.name = rec.name;
+                        item.querySelector('.recording-name').textContent = rec.name;
+                        item.querySelector('.recording-info').textContent = `${rec.size_mb} MB • ${rec.date}`;
+                        const download = item.querySelector('.download-btn');
+                        const del = item.querySelector('.delete-btn');
+                        download.disabled = del.disabled = isRecording;
+                        frag.appendChild(item);
+                    }
+                    recordingsList.replaceChildren(frag);
+                }
+            } else {
+                recordingsEtag = null;
+                recordingsLoadedAt = 0;
+                recordingsList.innerHTML = '<div class="empty-message">Error loading recordings</div>';
+            }
+        })
+        .catch(err => {
+            recordingsEtag = null;
+            recordingsLoadedAt = 0;
+            recordingsList.innerHTML = '<div class="empty-message">Error loading recordings</div>';
+        });
+}
+
+// One listener for every row's buttons; the row carries the file name
+recordingsList.addEventListener('click', e => {
+    const btn = e.target.closest('button[data-action]');
+    if (!btn) {
+        return;
+    }
+    const row = btn.closest('.recording-item');
+    if (btn.dataset.action === 'download') {
+        downloadRecording(row.dataset.name);
+    } else if (btn.dataset.action === 'delete') {
+        deleteRecording(row.dataset.name, row);
+    }
+});
+
+function downloadRecording(filename) {
+    if (isRecording) {
+        alert('Cannot download while recording');
+        return;
+    }
+    window.location.href = `/download/${filename}`;
+}
+
+function deleteRecording(filename, row) {
+    if (isRecording) {
+        alert('Cannot delete while recording');
+        return;
+    }
+
+    if (!confirm(`Delete ${filename}?`)) {
+        return;
+    }
+
+    safePost(`/delete/${filename}`)
+        .then(data => {
+            if (!data) {
+                return;
+            }
+            if (data.status === 'success') {
+                // Only this row changed - no need to fetch the whole list again
+                const list = row.parentNode;
+                row.remove();
+                if (!list.querySelector('.recording-item')) {
+                    list.innerHTML = '<div class="empty-message">No recordings found</div>';
+                }
+            } else {
+                alert('Error: ' + data.message);
+            }
+        })
+        .catch(err => alert('Error: ' + err));
+}
+
+function saveSettings() {
+    const streamRes = document.getElementById('streamRes').value.split(',');
+    const streamFps = document.getElementById('streamFps').value;
+    const streamQuality = document.getElementById('streamQuality').value;
+    const recordRes = document.getElementById('recordRes').value.split(',');
+    const recordFps = document.getElementById('recordFps').value;
+
+    statusEl.textContent = 'Status: Applying settings...';
+    statusEl.classList.remove('error');
+
+    // A flat form body is smaller than JSON and cheaper for Flask to parse
+    safePost('/update_settings', {
+        body: new URLSearchParams({
+            stream_width: streamRes[0],
+            stream_height: streamRes[1],
+            stream_fps: streamFps,
+            stream_quality: streamQuality,
+            record_width: recordRes[0],
+            record_height: recordRes[1],
+            record_fps: recordFps
+        })
+    }, document.querySelector('.save-btn'))
+        .then(data => {
+            if (!data) {
+                return;
+            }
+            // If the camera was restarted, the new stream epoch reconnects the stream
+            statusEl.textContent = 'Status: Settings applied';
+        })
+        .catch(err => {
+            statusEl.textContent = 'Status: Error applying settings - ' + err;
+            statusEl.classList.add('error');
+        });
+}
+
+function rebootPi() {
+    if (isRecording) {
+        alert('Cannot reboot while recording');
+        return;
+    }
+    if (!confirm('Are you sure you want to reboot the Raspberry Pi?')) {
+        return;
+    }
+    const btn = document.querySelector('.reboot-btn');
+    btn.disabled = true;
+    btn.textContent = 'REBOOTING...';
+    // No button passed - it stays disabled once the reboot is under way
+    safePost('/reboot')
+        .then(data => {
+            if (!data) {
+                return;
+            }
+            if (data.status === 'success') {
+                statusEl.textContent = 'Status: Rebooting...';
+                setTimeout(() => {
+                    statusEl.textContent = 'Status: Pi is rebooting. Please wait ~30s then refresh this page.';
+                }, 2000);
+            } else {
+                alert('Error: ' + data.message);
+                btn.disabled = false;
+                btn.textContent = 'REBOOT';
+            }
+        })
+        .catch(err => {
+            alert('Reboot error: ' + err);
+            btn.disabled = false;
+            btn.textContent = 'REBOOT';
+        });
+}
+
+function logout() {
+    if (!confirm('Logout?')) {
+        return;
+    }
+
+    fetch('/logout', { method: 'POST' })
+        .then(() => {
+            window.location.href = '/';
+        })
+        .catch(err => {
+            alert('Logout error: ' + err);
+            window.location.href = '/';
+        });
+}
+
+function applyStatus(data) {
+    cameraReady = data.camera_ready;
+    limitResolutions(data.sensor_resolution);
+
+    if (data.recording !== isRecording) {
+        isRecording = data.recording;
+        updateUI();
+    }
+    if (!isRecording) {
+        updateStatusDisplay(data);
+    }
+    applyStreamEpoch(data);
+}
+
+// Pushes that arrive within one frame collapse into a single DOM update
+let pendingStatus = null;
+function scheduleStatus(data) {
+    if (pendingStatus === null) {
+        requestAnimationFrame(() => {
+            const latest = pendingStatus;
+            pendingStatus = null;
+            applyStatus(latest);
+        });
+    }
+    pendingStatus = data;
+}
+
+// Server pushes state changes; EventSource reconnects by itself if the link drops
+let events = null;
+let statusPoll = null;
+let statusTag = '';
+let statusAbort = null;
+let statusSeq = 0;
+
+// Fallback when the push stream is unavailable. The ETag turns unchanged polls into
+// empty 304s, so there is nothing to parse between state changes.
+function pollStatus() {
+    // A slow Pi can still be answering the last poll - drop it, and never let a late answer win
+    if (statusAbort) {
+        statusAbort.abort();
+    }
+    statusAbort = new AbortController();
+    const seq = ++statusSeq;
+    fetch('/status', { cache: 'no-store', headers: { 'If-None-Match': statusTag }, signal: statusAbort.signal })
+        .then(r => {
+            if (seq !== statusSeq || r.status === 304 || !r.ok) {
+                return null;
+            }
+            statusTag = r.headers.get('ETag') || '';
+            return r.json();
+        })
+        .then(data => {
+            if (data && seq === statusSeq) {
+                scheduleStatus(data);
+            }
+        })
+        .catch(err => {
+            if (err.name !== 'AbortError') {
+                console.log('Status check failed:', err);
+            }
+        });
+}
+
+function startPolling() {
+    statusTag = '';
+    pollStatus();
+    statusPoll = setInterval(pollStatus, 1000);
+}
+
+function openEvents() {
+    if (!window.EventSource) {
+        startPolling();
+        return;
+    }
+    events = new EventSource('/events');
+    events.onmessage = e => scheduleStatus(JSON.parse(e.data));
+    events.onerror = err => {
+        console.log('Status stream error:', err);
+        // CLOSED means the browser has given up reconnecting, e.g. a proxy refused the stream
+        if (events && events.readyState === EventSource.CLOSED) {
+            events = null;
+            startPolling();
+        }
+    };
+}
+
+function closeEvents() {
+    if (events) {
+        events.close();
+        events = null;
+    }
+    if (statusPoll) {
+        clearInterval(statusPoll);
+        statusPoll = null;
+    }
+    if (statusAbort) {
+        statusAbort.abort();
+        statusAbort = null;
+    }
+}
+
+// A hidden tab doesn't need status - drop the connection and pick up the current state on return
+document.addEventListener('visibilitychange', () => {
+    if (document.hidden) {
+        closeEvents();
+    } else if (!events && !statusPoll) {
+        openEvents();
+    }
+});
+
+if (!document.hidden) {
+    openEvents();
+}
+'''
+
 WEB_INTERFACE = '''
 <!DOCTYPE html>
 <html>
 <head>
     <title>FTC Robot Camera</title>
     <meta name="viewport" content="width=device-width, initial-scale=1">
-    <style>
-        * { margin: 0; padding: 0; box-sizing: border-box; }
-        body {
-            font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Arial, sans-serif;
-            background: #000;
-            color: #fff;
-            overflow-x: hidden;
-            display: flex;
-            align-items: center;
-            justify-content: center;
-        }
-        .container {
-            max-width: 720px;
-            padding: 10px;
-            position: relative;
-        }
-        #stream {
-            height: auto;
-            display: block;
-            border: 2px solid #333;
-            border-radius: 8px;
-            background: #1a1a1a;
-            min-height: 240px;
-            object-fit: contain;
-            width: 100%;
-        }
-        @media (min-width: 750px) {
-            #stream {
-                width: 640px;
-            }
-        }
-        .controls {
-            margin-top: 15px;
-            display: flex;
-            flex-direction: column;
-            gap: 10px;
-        }
-        button {
-            padding: 15px 20px;
-            font-size: 16px;
-            font-weight: 600;
-            border: none;
-            border-radius: 8px;
-            cursor: pointer;
-            transition: all 0.2s;
-        }
-        .record-btn {
-            background: #dc3545;
-            color: white;
-        }
-        .record-btn:active { background: #c82333; }
-        .record-btn.recording {
-            background: #28a745;
-            animation: pulse 1.5s infinite;
-        }
-        .record-btn:disabled {
-            background: #555;
-            cursor: not-allowed;
-        }
-        @keyframes pulse {
-            0%, 100% { opacity: 1; }
-            50% { opacity: 0.7; }
-        }
-        .settings-btn {
-            background: #6c757d;
-            color: white;
-        }
-        .settings-btn:active { background: #5a6268; }
-        .status {
-            background: #1a1a1a;
-            padding: 12px;
-            border-radius: 8px;
-            margin-top: 10px;
-            font-size: 14px;
-        }
-        .status.error {
-            background: #dc3545;
-        }
-        .settings-panel {
-            display: none;
-            background: #1a1a1a;
-            padding: 15px;
-            border-radius: 8px;
-            margin-top: 10px;
-        }
-        .settings-panel.active { display: block; }
-        .setting-group {
-            margin-bottom: 15px;
-        }
-        .setting-group label {
-            display: block;
-            margin-bottom: 5px;
-            font-size: 14px;
-            color: #aaa;
-        }
-        .setting-group select {
-            width: 100%;
-            padding: 10px;
-            background: #2a2a2a;
-            border: 1px solid #444;
-            border-radius: 5px;
-            color: #fff;
-            font-size: 14px;
-        }
-        h3 {
-            color: #4CAF50;
-            margin-bottom: 15px;
-            font-size: 16px;
-        }
-        .save-btn {
-            background: #007bff;
-            color: white;
-            width: 100%;
-        }
-        .save-btn:active { background: #0056b3; }
-        .info-text {
-            color: #aaa;
-            font-size: 12px;
-            margin-top: 5px;
-        }
-        .recordings-panel {
-            display: none;
-            background: #1a1a1a;
-            padding: 15px;
-            border-radius: 8px;
-            margin-top: 10px;
-            max-height: 400px;
-            overflow-y: auto;
-        }
-        .recordings-panel.active { display: block; }
-        .recording-item {
-            background: #2a2a2a;
-            padding: 12px;
-            border-radius: 5px;
-            margin-bottom: 10px;
-        }
-        .recording-name {
-            font-weight: 600;
-            color: #fff;
-            margin-bottom: 5px;
-        }
-        .recording-info {
-            font-size: 12px;
-            color: #aaa;
-            margin-bottom: 8px;
-        }
-        .recording-actions {
-            display: flex;
-            gap: 8px;
-        }
-        .download-btn {
-            background: #28a745;
-            color: white;
-            padding: 8px 12px;
-            font-size: 14px;
-            flex: 1;
-        }
-        .download-btn:active { background: #218838; }
-        .download-btn:disabled {
-            background: #555;
-            cursor: not-allowed;
-        }
-        .delete-btn {
-            background: #dc3545;
-            color: white;
-            padding: 8px 12px;
-            font-size: 14px;
-            flex: 1;
-        }
-        .delete-btn:active { background: #c82333; }
-        .delete-btn:disabled {
-            background: #555;
-            cursor: not-allowed;
-        }
-        .empty-message {
-            text-align: center;
-            color: #aaa;
-            padding: 20px;
-        }
-        .recordings-btn {
-            background: #17a2b8;
-            color: white;
-        }
-        .recordings-btn:active { background: #138496; }
-        .logout-btn {
-            background: #dc3545;
-            color: white;
-            font-size: 14px;
-            padding: 10px 15px;
-            position: absolute;
-            top: 10px;
-            right: 10px;
-        }
-        .logout-btn:active { background: #c82333; }
-        .user-info {
-            position: absolute;
-            top: 10px;
-            left: 10px;
-            color: #aaa;
-            font-size: 12px;
-        }
-        .reboot-btn {
-            background: #ff9800;
-            color: white;
-            font-size: 14px;
-            padding: 10px 15px;
-            position: absolute;
-            top: 10px;
-            right: 110px;
-        }
-        .reboot-btn:active { background: #e68900; }
-        .latency-indicator {
-            position: absolute;
-            top: 60px;
-            right: 10px;
-            background: rgba(0, 0, 0, 0.7);
-            padding: 8px 12px;
-            border-radius: 5px;
-            font-size: 12px;
-            color: #4CAF50;
-        }
-    </style>
+    <!-- Open the stream before the stylesheet arrives; same URL as the <img> so the response is reused -->
+    <link rel="preload" as="image" href="{{ url_for('video_feed') }}" fetchpriority="high">
+    <link rel="stylesheet" href="{{ url_for('asset', name=css_asset) }}">
 </head>
 <body>
     <div class="container">
         <div class="user-info">
-            Logged in as <strong id="username">User</strong>
+            Logged in as <strong id="username">{{ username }}</strong>
         </div>
         <button class="logout-btn" onclick="logout()">LOGOUT</button>
         <button class="reboot-btn" onclick="rebootPi()">REBOOT</button>
         <div class="latency-indicator" id="latencyIndicator">Latency: --ms</div>
 
-        <img id="stream" src="{{ url_for('video_feed') }}" alt="Camera Stream" onerror="handleStreamError()">
+        <img id="stream" src="{{ url_for('video_feed') }}" alt="Camera Stream" fetchpriority="high" onerror="handleStreamError()">
         
         <div class="controls">
             <button id="recordBtn" class="record-btn" onclick="toggleRecording()">
@@ -1035,67 +2128,28 @@ WEB_INTERFACE = '''
             <h3>Stream Settings (Affects Latency)</h3>
             <div class="setting-group">
                 <label>Resolution</label>
-                <select id="streamRes">
-                    <option value="192,144">192x144 (Ultra Low Latency)</option>
-                    <option value="320,240" selected>320x240 (Low Latency - Recommended)</option>
-                    <option value="424,240">424x240 (16:9 Low Latency)</option>
-                    <option value="480,320">480x320 (Compact 3:2)</option>
-                    <option value="640,360">640x360 (16:9 Balanced)</option>
-                    <option value="640,480">640x480 (4:3 Balanced)</option>
-                    <option value="800,450">800x450 (16:9 High Quality)</option>
-                    <option value="800,600">800x600 (4:3 High Quality)</option>
-                </select>
+                <select id="streamRes"></select>
                 <div class="info-text">⚠️ Lower resolution = much less latency</div>
             </div>
             <div class="setting-group">
                 <label>FPS</label>
-                <select id="streamFps">
-                    <option value="15">15 FPS (Lowest Bandwidth)</option>
-                    <option value="24">24 FPS (Good Balance)</option>
-                    <option value="30" selected>30 FPS (Smooth)</option>
-                </select>
+                <select id="streamFps"></select>
             </div>
             <div class="setting-group">
                 <label>Quality (JPEG Compression)</label>
-                <select id="streamQuality">
-                    <option value="30">30% (Lowest Latency)</option>
-                    <option value="40">40% (Very Low Latency)</option>
-                    <option value="50" selected>50% (Low Latency - Recommended)</option>
-                    <option value="60">60% (Balanced)</option>
-                    <option value="70">70% (Good Quality)</option>
-                    <option value="80">80% (High Quality)</option>
-                </select>
+                <select id="streamQuality"></select>
                 <div class="info-text">⚠️ Lower quality = smaller files = less latency</div>
             </div>
 
             <h3 style="margin-top: 20px;">Recording Settings</h3>
             <div class="setting-group">
                 <label>Resolution</label>
-                <select id="recordRes">
-                    <option value="640,480">640x480 (SD)</option>
-                    <option value="1024,768">1024x768 (4:3 Medium)</option>
-                    <option value="1280,720">1280x720 (HD 16:9)</option>
-                    <option value="1280,960">1280x960 (HD 4:3)</option>
-                    <option value="1440,1080">1440x1080 (2MP 4:3)</option>
-                    <option value="1600,1200">1600x1200 (2MP 4:3)</option>
-                    <option value="1920,1440">1920x1440 (3MP 4:3)</option>
-                    <option value="1920,1080" selected>1920x1080 (Full HD 16:9)</option>
-                    <option value="2048,1152">2048x1152 (Oversampled 16:9)</option>
-                    <option value="2592,1458">2592x1458 (Max 16:9 Crop)</option>
-                    <option value="2592,1080">2592x1080 (Super-Wide 2.40:1)</option>
-                    <option value="2592,1944">2592x1944 (5MP Full Sensor 4:3)</option>
-                </select>
+                <select id="recordRes"></select>
                 <div class="info-text">Recording resolution (independent of stream)</div>
             </div>
             <div class="setting-group">
                 <label>FPS</label>
-                <select id="recordFps">
-                    <option value="15">15 FPS (Low Light)</option>
-                    <option value="24">24 FPS (Cinematic)</option>
-                    <option value="30" selected>30 FPS (Standard)</option>
-                    <option value="45">45 FPS (Fast Smooth)</option>
-                    <option value="60">60 FPS (High Motion)</option>
-                </select>
+                <select id="recordFps"></select>
             </div>
 
             <div class="info-text" style="margin: 15px 0;">
@@ -1113,376 +2167,87 @@ WEB_INTERFACE = '''
         </div>
     </div>
 
-    <script>
-        let isRecording = false;
-        let cameraReady = false;
-        let lastFrameTime = Date.now();
-
-        // Monitor stream for latency
-        const streamImg = document.getElementById('stream');
-        streamImg.addEventListener('load', function() {
-            const now = Date.now();
-            const latency = now - lastFrameTime;
-            lastFrameTime = now;
-            
-            const indicator = document.getElementById('latencyIndicator');
-            if (latency < 200) {
-                indicator.style.color = '#4CAF50'; // Green
-                indicator.textContent = `Latency: ${latency}ms (Good)`;
-            } else if (latency < 500) {
-                indicator.style.color = '#ff9800'; // Orange
-                indicator.textContent = `Latency: ${latency}ms (OK)`;
-            } else {
-                indicator.style.color = '#dc3545'; // Red
-                indicator.textContent = `Latency: ${latency}ms (High)`;
-            }
-        });
-
-        // Load current settings on page load
-        function loadCurrentSettings() {
-            fetch('/status')
-                .then(r => r.json())
-                .then(data => {
-                    cameraReady = data.camera_ready;
-                    
-                    // Update stream settings
-                    const streamRes = `${data.stream_config.width},${data.stream_config.height}`;
-                    document.getElementById('streamRes').value = streamRes;
-                    document.getElementById('streamFps').value = data.stream_config.fps;
-                    document.getElementById('streamQuality').value = data.stream_config.quality;
-                    
-                    // Update record settings
-                    const recordRes = `${data.record_config.width},${data.record_config.height}`;
-                    document.getElementById('recordRes').value = recordRes;
-                    document.getElementById('recordFps').value = data.record_config.fps;
-                    
-                    // Update initial status
-                    updateStatusDisplay(data);
-                })
-                .catch(err => {
-                    console.log('Failed to load settings:', err);
-                    document.getElementById('status').textContent = 'Status: Waiting for camera...';
-                    document.getElementById('status').classList.remove('error');
-                });
-        }
-
-        function updateStatusDisplay(data) {
-            const status = document.getElementById('status');
-            
-            if (data.recording) {
-                status.textContent = 'Status: Recording... (stream paused)';
-                status.classList.remove('error');
-            } else if (data.camera_ready) {
-                status.textContent = 'Status: Ready';
-                status.classList.remove('error');
-            } else if (data.stream_active) {
-                status.textContent = 'Status: Camera initializing...';
-                status.classList.remove('error');
-            } else {
-                status.textContent = 'Status: Waiting for camera...';
-                status.classList.remove('error');
-            }
-        }
-
-        // Load settings when page loads
-        loadCurrentSettings();
-
-        function handleStreamError() {
-            document.getElementById('status').textContent = 'Status: Camera stream error - refreshing...';
-            document.getElementById('status').classList.add('error');
-            setTimeout(() => {
-                document.getElementById('stream').src = '{{ url_for("video_feed") }}?' + new Date().getTime();
-            }, 2000);
-        }
-
-        function toggleRecording() {
-            if (!cameraReady) {
-                alert('Camera not ready. Please wait...');
-                return;
-            }
-
-            const btn = document.getElementById('recordBtn');
-            btn.disabled = true;
-            
-            const url = isRecording ? '/stop_recording' : '/start_recording';
-            
-            fetch(url, { method: 'POST' })
-                .then(r => r.json())
-                .then(data => {
-                    btn.disabled = false;
-                    if (data.status === 'success') {
-                        isRecording = !isRecording;
-                        updateUI();
-                    } else {
-                        alert('Error: ' + data.message);
-                        document.getElementById('status').textContent = 'Status: Error - ' + data.message;
-                        document.getElementById('status').classList.add('error');
-                    }
-                })
-                .catch(err => {
-                    btn.disabled = false;
-                    alert('Error: ' + err);
-                    document.getElementById('status').textContent = 'Status: Connection error';
-                    document.getElementById('status').classList.add('error');
-                });
-        }
-
-        function updateUI() {
-            const btn = document.getElementById('recordBtn');
-            const status = document.getElementById('status');
-            status.classList.remove('error');
-            
-            if (isRecording) {
-                btn.textContent = 'STOP RECORDING';
-                btn.classList.add('recording');
-                status.textContent = 'Status: Recording... (stream paused)';
-            } else {
-                btn.textContent = 'START RECORDING';
-                btn.classList.remove('recording');
-                status.textContent = 'Status: Restarting camera...';
-                
-                let retries = 0;
-                const maxRetries = 10;
-                const recheckInterval = setInterval(() => {
-                    fetch('/status')
-                        .then(r => r.json())
-                        .then(data => {
-                            if (data.camera_ready && data.stream_active) {
-                                clearInterval(recheckInterval);
-                                status.textContent = 'Status: Reconnecting stream...';
-                                
-                                setTimeout(() => {
-                                    document.getElementById('stream').src = '{{ url_for("video_feed") }}?' + new Date().getTime();
-                                    status.textContent = 'Status: Ready';
-                                }, 500);
-                            } else if (retries >= maxRetries) {
-                                clearInterval(recheckInterval);
-                                status.textContent = 'Status: Camera timeout - refresh page';
-                                status.classList.add('error');
-                            }
-                            retries++;
-                        })
-                        .catch(err => {
-                            retries++;
-                            if (retries >= maxRetries) {
-                                clearInterval(recheckInterval);
-                                status.textContent = 'Status: Connection error - refresh page';
-                                status.classList.add('error');
-                            }
-                        });
-                }, 1000);
-            }
-        }
-
-        function toggleSettings() {
-            const panel = document.getElementById('settingsPanel');
-            const recordingsPanel = document.getElementById('recordingsPanel');
-            
-            recordingsPanel.classList.remove('active');
-            panel.classList.toggle('active');
-        }
-
-        function toggleRecordings() {
-            const panel = document.getElementById('recordingsPanel');
-            const settingsPanel = document.getElementById('settingsPanel');
-            
-            settingsPanel.classList.remove('active');
-            
-            const wasActive = panel.classList.contains('active');
-            panel.classList.toggle('active');
-            
-            if (!wasActive) {
-                loadRecordings();
-            }
-        }
-
-        function loadRecordings() {
-            const list = document.getElementById('recordingsList');
-            list.innerHTML = '<div class="empty-message">Loading recordings...</div>';
-            
-            fetch('/list_recordings')
-                .then(r => r.json())
-                .then(data => {
-                    if (data.status === 'success') {
-                        if (data.recordings.length === 0) {
-                            list.innerHTML = '<div class="empty-message">No recordings found</div>';
-                        } else {
-                            list.innerHTML = data.recordings.map(rec => `
-                                <div class="recording-item">
-                                    <div class="recording-name">${rec.name}</div>
-                                    <div class="recording-info">
-                                        ${rec.size_mb} MB • ${rec.date}
-                                    </div>
-                                    <div class="recording-actions">
-                                        <button class="download-btn" onclick="downloadRecording('${rec.name}')" 
-                                                ${isRecording ? 'disabled' : ''}>
-                                            DOWNLOAD
-                                        </button>
-                                        <button class="delete-btn" onclick="deleteRecording('${rec.name}')"
-                                                ${isRecording ? 'disabled' : ''}>
-                                            DELETE
-                                        </button>
-                                    </div>
-                                </div>
-                            `).join('');
-                        }
-                    } else {
-                        list.innerHTML = '<div class="empty-message">Error loading recordings</div>';
-                    }
-                })
-                .catch(err => {
-                    list.innerHTML = '<div class="empty-message">Error loading recordings</div>';
-                });
-        }
-
-        function downloadRecording(filename) {
-            if (isRecording) {
-                alert('Cannot download while recording');
-                return;
-            }
-            window.location.href = `/download/${filename}`;
-        }
-
-        function deleteRecording(filename) {
-            if (isRecording) {
-                alert('Cannot delete while recording');
-                return;
-            }
-            
-            if (!confirm(`Delete ${filename}?`)) {
-                return;
-            }
-            
-            fetch(`/delete/${filename}`, { method: 'POST' })
-                .then(r => r.json())
-                .then(data => {
-                    if (data.status === 'success') {
-                        loadRecordings();
-                    } else {
-                        alert('Error: ' + data.message);
-                    }
-                })
-                .catch(err => alert('Error: ' + err));
-        }
-
-        function saveSettings() {
-            const streamRes = document.getElementById('streamRes').value.split(',');
-            const streamFps = document.getElementById('streamFps').value;
-            const streamQuality = document.getElementById('streamQuality').value;
-            const recordRes = document.getElementById('recordRes').value.split(',');
-            const recordFps = document.getElementById('recordFps').value;
-
-            const status = document.getElementById('status');
-            status.textContent = 'Status: Applying settings...';
-            status.classList.remove('error');
-
-            fetch('/update_stream_settings', {
-                method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({
-                    width: parseInt(streamRes[0]),
-                    height: parseInt(streamRes[1]),
-                    fps: parseInt(streamFps),
-                    quality: parseInt(streamQuality)
-                })
-            }).then(() => {
-                setTimeout(() => {
-                    document.getElementById('stream').src = '{{ url_for("video_feed") }}?' + new Date().getTime();
-                    status.textContent = 'Status: Stream settings applied';
-                }, 1500);
-            });
-
-            fetch('/update_record_settings', {
-                method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({
-                    width: parseInt(recordRes[0]),
-                    height: parseInt(recordRes[1]),
-                    fps: parseInt(recordFps)
-                })
-            });
-        }
-
-        function rebootPi() {
-            if (isRecording) {
-                alert('Cannot reboot while recording');
-                return;
-            }
-            if (!confirm('Are you sure you want to reboot the Raspberry Pi?')) {
-                return;
-            }
-            const btn = document.querySelector('.reboot-btn');
-            btn.disabled = true;
-            btn.textContent = 'REBOOTING...';
-            fetch('/reboot', { method: 'POST' })
-                .then(r => r.json())
-                .then(data => {
-                    if (data.status === 'success') {
-                        document.getElementById('status').textContent = 'Status: Rebooting...';
-                        setTimeout(() => {
-                            document.getElementById('status').textContent = 'Status: Pi is rebooting. Please wait ~30s then refresh this page.';
-                        }, 2000);
-                    } else {
-                        alert('Error: ' + data.message);
-                        btn.disabled = false;
-                        btn.textContent = 'REBOOT';
-                    }
-                })
-                .catch(err => {
-                    alert('Reboot error: ' + err);
-                    btn.disabled = false;
-                    btn.textContent = 'REBOOT';
-                });
-        }
-
-        function logout() {
-            if (!confirm('Logout?')) {
-                return;
-            }
-            
-            fetch('/logout', { method: 'POST' })
-                .then(() => {
-                    window.location.href = '/';
-                })
-                .catch(err => {
-                    alert('Logout error: ' + err);
-                    window.location.href = '/';
-                });
-        }
+    <template id="recordingRow">
+        <div class="recording-item">
+            <div class="recording-name"></div>
+            <div class="recording-info"></div>
+            <div class="recording-actions">
+                <button class="download-btn" data-action="download">DOWNLOAD</button>
+                <button class="delete-btn" data-action="delete">DELETE</button>
+            </div>
+        </div>
+    </template>
 
-        document.getElementById('username').textContent = 'User';
-
-        setInterval(() => {
-            fetch('/status')
-                .then(r => r.json())
-                .then(data => {
-                    cameraReady = data.camera_ready;
-                    
-                    if (data.recording !== isRecording) {
-                        isRecording = data.recording;
-                        updateUI();
-                    } else if (!isRecording) {
-                        updateStatusDisplay(data);
-                    }
-                })
-                .catch(err => {
-                    console.log('Status check failed:', err);
-                });
-        }, 1000);
-    </script>
+    <script src="{{ url_for('asset', name=js_asset) }}"></script>
 </body>
 </html>
 '''
 
+def precompress(body):
+    """Return (body, gzipped body, etag) for content that is served unchanged for the process lifetime"""
+    return body, gzip.compress(body, 9), hashlib.sha1(body).hexdigest()[:16]
+
+def minify(text):
+    """Drop indentation, blank lines and whole-line // comments from page source"""
+    # Line breaks stay, so JS semicolon insertion and spacing between inline elements are unchanged
+    lines = (line.strip() for line in text.splitlines())
+    return '\n'.join(line for line in lines if line and not line.startswith('//'))
+
+def register_asset(stem, ext, text, mimetype):
+    """Add a text asset to ASSETS under a content-hashed name and return that name"""
+    content = precompress(minify(text).encode('utf-8'))
+    name = f"{stem}.{content[2][:8]}.{ext}"
+    ASSETS[name] = (content, mimetype)
+    return name
+
+def prerender(template, **context):
+    """Render a page template once and return (body bytes, gzipped body, etag)"""
+    return precompress(render_template_string(minify(template), **context).encode('utf-8'))
+
+# Static assets by hashed file name -> ((body, gzipped body, etag), mimetype)
+ASSETS = {}
+
+# The pages only template url_for and asset names, so they never change at runtime - render them once
+with app.test_request_context():
+    LOGIN_PAGE = prerender(LOGIN_INTERFACE)
+    # There is a single account, so its name can be baked into the pre-rendered page
+    WEB_PAGE = prerender(WEB_INTERFACE, username=DEFAULT_USERNAME,
+                         css_asset=register_asset('app', 'css', WEB_CSS, 'text/css'),
+                         js_asset=register_asset('app', 'js', WEB_JS, 'application/javascript'))
+
+class NoDelayRequestHandler(WSGIRequestHandler):
+    """Request handler with Nagle disabled, so each stream part is sent as soon as it's written"""
+
+    def setup(self):
+        super().setup()
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
 if __name__ == '__main__':
     print("Starting FTC Robot Camera Server...")
     print("Access from phone: http://<raspberry-pi-ip>:8080")
     print("Press Ctrl+C to stop")
     try:
-        app.run(host='0.0.0.0', port=8080, threaded=True, debug=False)
+        os.makedirs(VIDEO_DIR, exist_ok=True)
+    except OSError as e:
+        print(f"Cannot create {VIDEO_DIR}: {e}")
+    frame_shm = open_frame_shm()
+    try:
+        app.run(host='0.0.0.0', port=8080, threaded=True, debug=False, request_handler=NoDelayRequestHandler)
     except KeyboardInterrupt:
+        pass
+    finally:
+        # Werkzeug handles Ctrl+C itself and returns from app.run(), so clean up on any exit
         print("\nShutting down...")
         stop_frame_grabber()
         if camera:
-            camera.stop()
+            close_camera(camera)
+        # Detach under the frame lock so a late encoder callback can't write into a closed block
+        with frame_ready:
+            shm, frame_shm = frame_shm, None
+        if shm is not None:
+            try:
+                shm.close()
+                shm.unlink()
+            except Exception as e:
+                print(f"Shared memory cleanup error: {e}")
         print("Server stopped")
\ No newline at end of file